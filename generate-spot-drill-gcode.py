@@ -116,7 +116,18 @@
 #         line 5 to end: coordinate pairs X Y. Floating point in selected units.
 #
 #      gcode file (ext = .nc)
-#         TBD
+#         line 1: G20 (inch) or G21 (mm), from the unit menu
+#         line 2: G90, absolute coordinates. Relative mode points are converted to absolute before
+#             they are written, so the gcode is always absolute.
+#         line 3: G0 rapid up to the retract height
+#         then for each point...
+#             G0 rapid to X Y
+#             G1 plunge to Z minus depth at the plunge rate
+#             G0 rapid back up to the retract height
+#         then G0 back to X0 Y0 and M2 end of program
+#         G, X, Y, Z and F words stay in effect until changed, so a word that repeats the one in
+#         effect is left out. For example, only the first G1 has an F, and a G0 to the next point
+#         right after a G0 retract is written as just X Y.
 #
 #
 # Revison History:
@@ -262,7 +273,8 @@
 # Generate Gcode. I'll run across other stuff, I'm sure.
 
 
-import numexpr as ne  # for allowing numeric expressions in coordinate fields
+import ast  # for allowing numeric expressions in coordinate fields
+import operator
 import tkinter as tk
 import tkinter.tix as tix
 from tkinter import ttk  # more widgets
@@ -270,16 +282,17 @@ from tkinter import filedialog
 from tkinter import messagebox as mb
 from tkinter import font
 import os
-import os.path
+import functools
+import io
+import logging
+import math
 import xml.etree.ElementTree as Et
-import xml
 
-# Point index constants. A point is a list of values with indices defined by these constants.
-POINTNUMBER = 0
-XWIDGET = 1
-YWIDGET = 2
-CHECKBUTTON = 3
-SELECTED = 4
+# Point index constants. A point is a list of values with indices defined by these constants. A point's
+# number is not stored; it is just the point's index in the points list.
+XWIDGET = 0
+YWIDGET = 1
+CHECKBUTTON = 2
 
 NONESELECTED = -1
 
@@ -287,20 +300,62 @@ XCOLUMN = 0
 YCOLUMN = 1
 SELECTBOXCOLUMN = 2
 
-POINTROWOFFSET = 3  # starting row of points list in the gui
-config_path = os.getcwd() + "/config"  # getcwd returns the current program working directory
+# grid options for the widgets of a point row, used every time a row is placed on the grid
+ENTRYGRIDOPTIONS = {'padx': 4, 'pady': 0}
+CHECKBUTTONGRIDOPTIONS = {'sticky': tk.W}
+
+POINTROWOFFSET = 0  # starting row of points list in points_frame
+POINTSFRAMEROW = 3  # row of the main window that points_frame goes in
+# the config file is kept next to this program, wherever it is started from
+config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config")
+USERHOMEPATH = os.path.expanduser("~").replace("\\", "/")  # user home, the starting place for data and gcode files
+
+# Characters that can be typed into a coordinate field. Anything else can never be part of a numeric
+# expression, so the entry widgets refuse it as it is typed. See valid_expression_keys.
+EXPRESSIONCHARACTERS = frozenset("0123456789.+-*/%() eE")
+# the most bad fields listed in one error box. See show_bad_fields.
+MAXBADFIELDSSHOWN = 10
+# the operators allowed in those expressions, and what each one does.
+EXPRESSIONOPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+                       ast.Div: operator.truediv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+                       ast.UAdd: operator.pos, ast.USub: operator.neg}
+
+# Debug output goes through the logging module. Set DEBUG to True to see it on the console.
+DEBUG = False
+logger = logging.getLogger(__name__)
 
 # set default file names. These will go into the configuration file
 DEFAULTDATAFILENAME = "generate_spot_drill_data_file"
 DEFAULTGCODEFILENAME = "gcode.nc"
 
+# height above the work (Z=0) that the tool is raised to between holes, in each unit
+RETRACTINCHES = 0.1
+RETRACTMM = 2.5
+
+MMPERINCH = 25.4
+# decimal places kept when a conversion writes numbers back into the input widgets, for each unit. Inches
+# get two more places than millimeters, more than the 25.4 between them can grow a rounding error, so
+# converting to the other unit and back gives the text that was there before. See format_number.
+UNITPLACES = {'Unit: Inches': 10, 'Unit: Millimeters': 8}
+
+# leave words that repeat the G, X, Y, Z or F already in effect out of the gcode. See generate_gcode.
+MODALGCODE = True
+
 # configuration information that reflects state that is saved between sessions. This information
 # is stored in a file and updated. This dictionary is used code in this program to access this data.
 config = {'default_data_path': '', 'default_data_file': '', 'default_gcode_path': '', 'default_gcode_file': ''}
 
-# code for finding and exploring fonts.
-# fonts = sorted(list(font.families()))
-# print(fonts)
+# The coordinate mode the points in the GUI are currently written in. The mode menu variable already holds
+# the new choice by the time its callback runs, so this is what tells the callback which way to convert.
+mode_in_use = 'Mode: Absolute'
+# Same thing for the unit menu.
+unit_in_use = 'Unit: Inches'
+
+# the data file the points in the GUI were read from or last saved to. Empty until there is one.
+current_data_file = ''
+
+# what the GUI starts with, and what New puts back, keyed by the data file tag of each value
+NEWDATA = {'unitsel': 'Unit: Inches', 'modesel': 'Mode: Absolute', 'depthexpr': '.1', 'plungeexpr': '1.5'}
 
 
 # the PointsList class is the main working data structure for this program.
@@ -308,9 +363,6 @@ class PointsList:
     #
     # The list of points in the application and methods for creating, deleting, etc.
     #
-    points = []
-    point_count = 0
-    row_selected = NONESELECTED  # NONESELECTED is none selected.
 
     #
     # Constructor initializes the points list to empty and the points count to zero
@@ -318,79 +370,95 @@ class PointsList:
     def __init__(self):
         self.points = []
         self.point_count = 0
-        self.row_selected = NONESELECTED
+        self.row_selected = NONESELECTED  # NONESELECTED is none selected.
+        self.check_button_rows = {}  # the row of each point's check button, for find_row
 
     #
     # Clear the object back to its initial state. Effectively remove all points
     #
     def clear(self):
-        self.clear_points_from_grid()
+        for point in self.points:
+            self.destroy_point_row(point)
         self.points = []
         self.point_count = 0
+        self.row_selected = NONESELECTED
+        self.check_button_rows = {}
 
     #
-    # append_point adds a point at the end of the list and adds a row to the gui point display.
-    # The GUI includes a selection check button on each line. That is added to each list element.
+    # append_point adds a point at the end of the list and adds a row to the gui point display,
+    # then selects the new row.
     #
     def append_point(self, x, y):
+        self.add_point_row(x, y)
+        #
+        # Select the new line so we can move it right away if desired
+        self.select_row(self.point_count - 1)
+
+    #
+    # append_points adds a whole list of (x, y) pairs, as when a data file is opened. The rows are
+    # created and placed in one pass without selecting each new row along the way (select_row visits
+    # every row, so doing that per point makes a load quadratic), and the window layout is brought
+    # up to date once at the end instead of whenever Tk next goes idle between points.
+    #
+    def append_points(self, pairs):
+        for x, y in pairs:
+            self.add_point_row(x, y)
+        window.update_idletasks()
+
+    #
+    # add_point_row does the work for append_point and append_points. It adds a point at the end of
+    # the list and adds a row to the gui point display. The GUI includes a selection check button on
+    # each line. That is added to each list element.
+    #
+    def add_point_row(self, x, y):
         self.point_count += 1
         index = self.point_count - 1  # The first point is point zero.
         #
-        # Create the entry widgets for this point
+        # Create the entry widgets for this point. They start out empty, so the value only needs
+        # to be inserted.
         #
-        xentry = tk.Entry(window)
-        xentry.delete(0, tk.END)
+        xentry = tk.Entry(points_frame)
         xentry.insert(0, x)
-        yentry = tk.Entry(window)
-        yentry.delete(0, tk.END)
+        yentry = tk.Entry(points_frame)
         yentry.insert(0, y)
         #
-        # create a booleanvariable to carry the information in the checkbutton used for selection.
-        checkvar = tk.BooleanVar()
-        # create the check button for this point. Its state change callback passes the index
-        # of this point, which will be used in the selection code.
-        # This is implemented as an inline (lambda) function that calls the callback
-        # with the argument.
-        check_button = tk.Checkbutton(window, variable=checkvar, command=lambda: check_select_change(index, checkvar))
+        # Filter keystrokes from here on. This is turned on after the initial value goes in, so a
+        # value read from a data file is never refused.
+        xentry.config(validate='key', validatecommand=expression_vcmd)
+        yentry.config(validate='key', validatecommand=expression_vcmd)
+        #
+        # create the check button for this point. Its state change callback passes the check button
+        # itself, which the selection code uses to find the row it is in now. Rows move when points
+        # above them are deleted, so the row number here would go stale. The check button has no
+        # variable of our own; row_selected says which one is checked.
+        # The callback is check_select_change with the check button bound as its argument by
+        # functools.partial, so no function has to be made for each point.
+        check_button = tk.Checkbutton(points_frame)
+        check_button.config(command=functools.partial(check_select_change, check_button))
         #
         # append these elements of the new point as a list to the end of the points list
-        self.points.append([index,
-                            xentry,
+        self.points.append([xentry,
                             yentry,
-                            check_button,
-                            checkvar])
+                            check_button])
+        self.check_button_rows[check_button] = index
         #
-        # place the entry widgets and check button on the grid. POINTROWOFFSET is the number of the
-        # grid row where we want the first point displayed. We are placing this point at the end
+        # place the entry widgets and check button on the grid. We are placing this point at the end
         # of the existing set of rows.
-        self.points[index][XWIDGET].grid(row=self.point_count + POINTROWOFFSET, column=XCOLUMN, padx=4, pady=0)
-        self.points[index][YWIDGET].grid(row=self.point_count + POINTROWOFFSET, column=YCOLUMN, padx=4, pady=0)
-        self.points[index][CHECKBUTTON].grid(row=self.point_count + POINTROWOFFSET, column=SELECTBOXCOLUMN, sticky=tk.W)
+        self.grid_point_row(index)
         #
         # set up event callback for entry widget loss of focus. This is so we can check whether the text
         # in the widget is a valid number
-        self.points[index][XWIDGET].bind('<FocusOut>', check_if_num)
-        self.points[index][YWIDGET].bind('<FocusOut>', check_if_num)
-        #
-        # Select the new line so we can move it right away if desired
-        self.select_row(index)
+        xentry.bind('<FocusOut>', check_if_num)
+        yentry.bind('<FocusOut>', check_if_num)
 
     # select_row mainly sets member variable row_selected to the specified row number. But it also
-    # unchecks the rest of the check buttons and checks the current one. This could be done by just
-    # forcing the existing check button to be unchecked, but to make sure we don't miss one, we just
-    # uncheck all buttons except the target one.
+    # unchecks the check button of the previously selected row and checks the current one. row_selected
+    # is always the only checked row, since deleting the selected point, clearing the list, and unchecking
+    # a box all set it to NONESELECTED, so that is the only button that needs unchecking.
     def select_row(self, row):
-        #
-        # deselect all points except the one in the target row.
-        #
-        print("row being selected" + str(row))
-        print("old row selected " + str(self.row_selected))
-        self.row_selected = NONESELECTED  # preset for the case that no row is selected
-        for pt in self.points:
-            if self.points.index(pt) == row:
-                pt[CHECKBUTTON].select()
-            else:
-                pt[CHECKBUTTON].deselect()
+        if self.row_selected != NONESELECTED and self.row_selected != row:
+            self.points[self.row_selected][CHECKBUTTON].deselect()
+        self.points[row][CHECKBUTTON].select()
         self.row_selected = row
 
     def deselect_row(self, row):
@@ -405,120 +473,311 @@ class PointsList:
         if self.row_selected == NONESELECTED:
             return
         #
-        # Clear the points display from the gui. We will add them back after the point
-        # is deleted and the other points are adjusted to fill the gap.
-        self.clear_points_from_grid()
-        #
-        # Since we are deleting a point, all points after it need to appear one lower in the list, thus
-        # higher in the physical window. This means we want to change the index number of those points
-        # to be one less, and associate the selection check button for each physical row with the point
-        # that moves to that row. In the code, the easiest way to do this is to start at the end of the
-        # list and work backward until we reach the point to be deleted. A special case is when the last
-        # point is the one being deleted, in which case we just delete that point and return.
+        # Destroy the widgets of the deleted point and take it out of the list. Point numbers are just
+        # list positions, so that renumbers the rest for free. The check buttons go along with their
+        # points, and the loop below brings their rows in check_button_rows up to date.
         #
-        # Traverse the points list in reverse
-        for pt in reversed(self.points):
-            # If this point is the point to be deleted, just delete it and decrement the point count.
-            # after this, we are done, so we break out of the loop.
-            if ptnum == pt[POINTNUMBER]:
-                del self.points[ptnum]
-                self.point_count -= 1
-                break
-            # If this point is not the point to be deleted, move the checkbutton from the adjacent
-            # lower point to this one, and decrement the point number so that it is right after
-            # a lower point is deleted.
-            else:
-                idx = pt[POINTNUMBER]
-                self.points[idx][CHECKBUTTON] = self.points[idx - 1][CHECKBUTTON]
-                self.points[idx][POINTNUMBER] = idx - 1
-                pt[CHECKBUTTON].deselect()
+        self.destroy_point_row(self.points[ptnum])
+        del self.check_button_rows[self.points[ptnum][CHECKBUTTON]]
+        del self.points[ptnum]
+        self.point_count -= 1
         #
-        # Now, with the target point gone, and the other points adjusted, we re-display the remaining points.
-        self.place_points_on_grid()
-
-    def read_point(self, ptnum):
-        values = (self.points[ptnum][POINTNUMBER],
-                  self.points[ptnum][XWIDGET].get(),
-                  self.points[ptnum][YWIDGET].get(),
-                  self.points[ptnum][SELECTED].get())
-        return values
-
-    def clear_points_from_grid(self):
-        for clrpoint in self.points:
-            clrpoint[XWIDGET].grid_remove()
-            clrpoint[YWIDGET].grid_remove()
-            clrpoint[CHECKBUTTON].grid_remove()
-
-    def place_points_on_grid(self):
-        for placeindex in range(0, len(self.points)):
-            self.points[placeindex][XWIDGET].grid(row=placeindex + POINTROWOFFSET,
-                                                  column=XCOLUMN,
-                                                  padx=4,
-                                                  pady=0)
-            self.points[placeindex][YWIDGET].grid(row=placeindex + POINTROWOFFSET,
-                                                  column=YCOLUMN,
-                                                  padx=4,
-                                                  pady=0)
-            self.points[placeindex][CHECKBUTTON].grid(row=placeindex + POINTROWOFFSET,
-                                                      column=SELECTBOXCOLUMN,
-                                                      sticky=tk.W)
+        # All points after the deleted one need to appear one row higher in the window. The points
+        # before it stay where they are. The deleted point was the selected one, so now none is.
+        for idx in range(ptnum, len(self.points)):
+            self.grid_point_row(idx)
+            self.check_button_rows[self.points[idx][CHECKBUTTON]] = idx
         self.row_selected = NONESELECTED
 
+    #
+    # find_row returns the row of the point whose selection check button is check_button. The rows
+    # are kept in check_button_rows, which delete_point updates for the points that move up.
+    # Moving a point swaps values, not check buttons, so it does not change any rows.
+    #
+    def find_row(self, check_button):
+        return self.check_button_rows.get(check_button, NONESELECTED)
+
+    #
+    # evaluate_points returns a list of (x, y) values for all of the points. Every coordinate is
+    # evaluated, and the ones that do not evaluate to a number are added to bad_fields and come back
+    # as None (see evaluate_field), so the list can only be used if bad_fields is still empty. With
+    # allow_blank, empty coordinates also come back as None, but are not bad.
+    #
+    def evaluate_points(self, bad_fields, allow_blank=False):
+        coords = []
+        for ptindex, point in enumerate(self.points):
+            x = evaluate_field("Point " + str(ptindex + 1) + " X", point[XWIDGET], bad_fields, allow_blank)
+            y = evaluate_field("Point " + str(ptindex + 1) + " Y", point[YWIDGET], bad_fields, allow_blank)
+            coords.append((x, y))
+        return coords
+
+    #
+    # write_points replaces the text of every point with the numbers in a list of (x, y) values, as
+    # returned by evaluate_points, written with the given number of decimal places (see UNITPLACES).
+    # Any expressions in the points are replaced by their values. A None value leaves its field alone.
+    #
+    def write_points(self, coords, places):
+        for point, (x, y) in zip(self.points, coords):
+            if x is not None:
+                set_entry_text(point[XWIDGET], format_number(x, places))
+            if y is not None:
+                set_entry_text(point[YWIDGET], format_number(y, places))
+
+    #
+    # destroy_point_row destroys the entry widgets and check button of a point, which also takes them
+    # off the grid. The point itself still has to be taken out of the list.
+    #
+    def destroy_point_row(self, point):
+        point[XWIDGET].destroy()
+        point[YWIDGET].destroy()
+        point[CHECKBUTTON].destroy()
+
+    #
+    # grid_point_row places the entry widgets and check button of one point on the points_frame grid,
+    # in the row that matches the point's position in the list. POINTROWOFFSET is the number of the
+    # grid row where we want the first point displayed. This is the one place that knows the layout
+    # of a point row.
+    #
+    def grid_point_row(self, index):
+        point = self.points[index]
+        row = index + POINTROWOFFSET
+        point[XWIDGET].grid(row=row, column=XCOLUMN, **ENTRYGRIDOPTIONS)
+        point[YWIDGET].grid(row=row, column=YCOLUMN, **ENTRYGRIDOPTIONS)
+        point[CHECKBUTTON].grid(row=row, column=SELECTBOXCOLUMN, **CHECKBUTTONGRIDOPTIONS)
+
     def move_point_forward(self, ptnum):
         #
-        # Move the target point x and y entry widgets forward in the points list by swapping with the next
+        # Move the target point x and y values forward in the points list by swapping with the next
         # point in the list, then select the destination line. This makes it possible to repeatedly move these
-        # values down the list. If this point is already the last one in the list, do nothing
+        # values down the list. If no point is selected, or this point is already the last one in the list,
+        # do nothing
         #
-        if ptnum == self.point_count-1:
+        if ptnum == NONESELECTED or ptnum == self.point_count-1:
             return
-        # remove the point lines from the grid
-        self.clear_points_from_grid()
-        # take a snapshot of the x and y widgets on this point
-        xtemp = self.points[ptnum][XWIDGET]
-        ytemp = self.points[ptnum][YWIDGET]
-        # copy the x and y widgets of the next point
-        self.points[ptnum][XWIDGET] = self.points[ptnum+1][XWIDGET]
-        self.points[ptnum][YWIDGET] = self.points[ptnum+1][YWIDGET]
-        # replace the x and y widgets of the next point by the snapshots
-        self.points[ptnum+1][XWIDGET] = xtemp
-        self.points[ptnum+1][YWIDGET] = ytemp
-        # re-display the point lines
-        self.place_points_on_grid()
+        self.swap_point_values(ptnum, ptnum+1)
         # move the selection to the new position of the moved point
         self.select_row(ptnum+1)
 
     def move_point_backward(self, ptnum):
         #
-        # Move the target point x and y entry widgets backward in the points list by swapping with the previous
+        # Move the target point x and y values backward in the points list by swapping with the previous
         # point in the list, then select the destination line. This makes it possible to repeatedly move these
-        # values up the list. If this point is already the first one in the list, do nothing
-        if ptnum == 0:
+        # values up the list. If no point is selected, or this point is already the first one in the list,
+        # do nothing
+        if ptnum == NONESELECTED or ptnum == 0:
             return
-        # remove the point lines from the grid
-        self.clear_points_from_grid()
-        # take a snapshot of the x and y widgets on this point
-        xtemp = self.points[ptnum][XWIDGET]
-        ytemp = self.points[ptnum][YWIDGET]
-        # copy the x and y widgets of the previous point
-        self.points[ptnum][XWIDGET] = self.points[ptnum-1][XWIDGET]
-        self.points[ptnum][YWIDGET] = self.points[ptnum-1][YWIDGET]
-        # replace the x and y widgets of the previous point by the snapshots
-        self.points[ptnum-1][XWIDGET] = xtemp
-        self.points[ptnum-1][YWIDGET] = ytemp
-        # re-display the point lines
-        self.place_points_on_grid()
+        self.swap_point_values(ptnum, ptnum-1)
         # move the selection to the new position of the moved point
         self.select_row(ptnum-1)
+
+    #
+    # swap_point_values exchanges the x and y text of two points, along with the background colors that
+    # show whether the text is a number and the text check_if_num last passed, so each value keeps its
+    # state as it moves. The widgets themselves stay in their rows, so nothing is regridded.
+    #
+    def swap_point_values(self, ptnum1, ptnum2):
+        point1 = self.points[ptnum1]
+        point2 = self.points[ptnum2]
+        for column in (XWIDGET, YWIDGET):
+            entry1 = point1[column]
+            entry2 = point2[column]
+            text1 = entry1.get()
+            bg1 = entry1.cget('bg')
+            checked1 = getattr(entry1, 'checked_text', None)
+            checked2 = getattr(entry2, 'checked_text', None)
+            set_entry_text(entry1, entry2.get())
+            set_entry_color(entry1, entry2.cget('bg'))
+            set_entry_text(entry2, text1)
+            set_entry_color(entry2, bg1)
+            entry1.checked_text = checked2
+            entry2.checked_text = checked1
 # end of PointList class
 
 
 # utility functions
 #
+# Evaluate the text from an input widget as a number. Most fields hold a plain number, which float()
+# reads directly. Anything else is parsed as a Python expression and evaluated by evaluate_node, which
+# only knows about numbers and arithmetic. Results are cached by text because the same strings are
+# evaluated again and again as focus moves around the window. Exceptions are not cached, so bad text
+# raises every time. Text nested too deeply for the parser or for evaluate_node, like a few thousand
+# minus signs in a row, is reported as a SyntaxError like any other text that is not a number. float()
+# also reads inf and nan, and arithmetic like 1e308*10 gives inf, but none of these is a place a drill
+# can go, so a result that is not finite is a ValueError.
+#
+@functools.lru_cache(maxsize=4096)
+def evaluate_expression(text):
+    try:
+        value = float(text)
+    except ValueError:
+        try:
+            value = float(evaluate_node(ast.parse(text, mode='eval').body))
+        except (RecursionError, MemoryError):
+            raise SyntaxError("expression is nested too deeply") from None
+    if not math.isfinite(value):
+        raise ValueError(text + " is not a finite number")
+    return value
+
+
+#
+# Evaluate one node of a parsed expression. All of the arithmetic is done in floating point, so something
+# like 9**9**9 overflows right away instead of building a huge integer. Any node that is not a number or
+# an operator in EXPRESSIONOPERATORS is rejected as a SyntaxError, the same as text that does not parse.
+#
+def evaluate_node(node):
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return float(node.value)
+    if isinstance(node, ast.BinOp) and type(node.op) in EXPRESSIONOPERATORS:
+        return EXPRESSIONOPERATORS[type(node.op)](evaluate_node(node.left), evaluate_node(node.right))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in EXPRESSIONOPERATORS:
+        return EXPRESSIONOPERATORS[type(node.op)](evaluate_node(node.operand))
+    raise SyntaxError("not an arithmetic expression")
+
+
+#
+# Evaluate the text in an input widget for one of the operations that need every value at once, like writing
+# gcode or converting between modes. Returns the value, or None if the text does not evaluate to a number,
+# in which case the widget is turned red and the field, described by name, is added to the bad_fields list.
+# Once all of the fields have been evaluated, show_bad_fields tells the user about all of them at once.
+# With allow_blank, an empty field also returns None but is left as it is, for operations like unit
+# conversion that can just skip a field that has not been filled in yet.
+#
+def evaluate_field(name, widget, bad_fields, allow_blank=False):
+    widget_value = widget.get().strip()
+    if allow_blank and not widget_value:
+        return None
+    try:
+        value = evaluate_expression(widget_value)
+    except (SyntaxError, ZeroDivisionError, OverflowError, TypeError, ValueError):
+        set_entry_color(widget, "RED")
+        bad_fields.append(name + ": " + widget_value)
+        return None
+    set_entry_color(widget, "WHITE")
+    return value
+
+
+#
+# Show the fields collected by evaluate_field in a single error box. Only the first MAXBADFIELDSSHOWN
+# are listed, since they are all marked in red anyway.
+#
+def show_bad_fields(bad_fields):
+    message = "These fields do not evaluate to a number:\n" + "\n".join(bad_fields[:MAXBADFIELDSSHOWN])
+    if len(bad_fields) > MAXBADFIELDSSHOWN:
+        message += "\n... and " + str(len(bad_fields) - MAXBADFIELDSSHOWN) + " more"
+    mb.showerror("error", message)
+
+
+#
+# Replace the text in an entry widget from code. Key validation is switched off while the new text goes in,
+# so it is never refused. The new text has not been through check_if_num, so the text it last passed
+# is forgotten.
+#
+def set_entry_text(widget, text):
+    validate = widget.cget('validate')
+    widget.config(validate='none')
+    widget.delete(0, tk.END)
+    widget.insert(0, text)
+    widget.config(validate=validate)
+    widget.checked_text = None
+
+
+#
+# Set the background color of an input widget, which is how a field shows whether its text is a good
+# number. evaluate_field goes through every field on each gcode run and conversion, and nearly all
+# of them are already the right color, so the color last set is kept on the widget and Tk is only asked
+# to change it when it is different.
+#
+def set_entry_color(widget, color):
+    if getattr(widget, 'entry_color', None) != color:
+        widget.config(bg=color)
+        widget.entry_color = color
+
+
+#
+# Format a number with up to the given number of decimal places and no trailing zeros, so 25.4 shows as
+# 25.4 and not 25.400000. Conversions use it to put numbers back into the input widgets, with the places
+# in UNITPLACES, and the gcode uses it with four places, so Z0 is written instead of Z0.0000.
+#
+def format_number(value, places):
+    text = f"{value:.{places}f}".rstrip("0").rstrip(".")
+    if text == "-0":
+        text = "0"
+    return text
+
+
+#
+# In relative mode, the first point is absolute and all of the others are relative to it. These convert
+# a list of (x, y) values between the two modes.
+#
+def relative_to_absolute(coords):
+    x0, y0 = coords[0]
+    return [coords[0]] + [(x + x0, y + y0) for x, y in coords[1:]]
+
+
+def absolute_to_relative(coords):
+    x0, y0 = coords[0]
+    return [coords[0]] + [(x - x0, y - y0) for x, y in coords[1:]]
+
+
+#
+# Generate the gcode for spot drilling a list of absolute (x, y) coordinates, returned as one string. The
+# layout is described in the gcode file section of the comments at the top. The lines are written into an
+# in-memory buffer rather than straight to the file, so the caller can write the whole thing at once.
+#
+def generate_gcode(depth, plunge_rate, coords, metric):
+    if metric:
+        units = "G21"
+        retract = RETRACTMM
+    else:
+        units = "G20"
+        retract = RETRACTINCHES
+    bottom = -abs(depth)  # depth is entered as a positive distance into the work
+    gcode = io.StringIO()
+    modal_words = {}  # the last value written for each of the G, X, Y, Z and F words
+
+    #
+    # Write one move. words is a list of (letter, value text) pairs. Motion (G0/G1), axis positions and
+    # feed rate stay in effect until they are changed, so with MODALGCODE on, a word that is the same as
+    # the last one written for its letter is left out.
+    #
+    def write_move(*words):
+        line = []
+        for letter, text in words:
+            if not MODALGCODE or modal_words.get(letter) != text:
+                line.append(letter + text)
+                modal_words[letter] = text
+        if line:
+            gcode.write(" ".join(line) + "\n")
+
+    gcode.write(units + "\n")
+    gcode.write("G90\n")
+    retract_text = format_number(retract, 4)
+    bottom_text = format_number(bottom, 4)
+    feed_text = format_number(plunge_rate, 4)
+    write_move(("G", "0"), ("Z", retract_text))
+    for x, y in coords:
+        write_move(("G", "0"), ("X", format_number(x, 4)), ("Y", format_number(y, 4)))
+        write_move(("G", "1"), ("Z", bottom_text), ("F", feed_text))
+        write_move(("G", "0"), ("Z", retract_text))
+    write_move(("G", "0"), ("X", "0"), ("Y", "0"))
+    gcode.write("M2\n")
+    return gcode.getvalue()
+
+
+#
+# Key validation callback for the coordinate entry widgets, registered with Tk as expression_vcmd. Tk calls
+# it before each insert or delete with the action (%d, '1' for insert) and the text being inserted or
+# deleted (%S), and refuses the change if it returns False. Typing a letter or other character that can
+# never appear in a number is just ignored this way, instead of being found later by check_if_num or when
+# the gcode is generated. Deletes are always allowed.
+#
+def valid_expression_keys(action, text):
+    return action != '1' or all(c in EXPRESSIONCHARACTERS for c in text)
+
+
 # Check that the text in an input widget is an expression that evaluates to a number. If not, turn the widget
 # background red and raise a message box.
 #
-# noinspection PyUnboundLocalVariable
 def check_if_num(event):
     widget = event.widget
     #
@@ -526,54 +785,101 @@ def check_if_num(event):
     # will throw one of a number of exceptions, which we catch and inform the user, setting
     # the widget background color to red.
     #
-    # Note: the ne.evaluate function compiles the argument as a Python language expression,
-    # and can encounter a number of errors during compilation or execution of that code. It executes
-    # the expression as written, so it will execute, for example, 1000**100 differently from 1000.**100,
-    # where the integer expression will overflow, and the floating point one will not. Practically,
-    # though, the expressions used in this application will be simple ones that don't generate such
-    # huge numbers.
+    # Note: evaluate_expression parses the argument as a Python language expression, and can
+    # encounter a number of errors while parsing or evaluating it. The arithmetic is done in floating
+    # point, so a result too big for a float overflows. A negative number raised to a fractional power
+    # gives a complex number, which float() rejects with a TypeError. Practically, though, the
+    # expressions used in this application will be simple ones that don't run into these.
+    #
+    # Tabbing through the fields takes focus from each one without changing it, so if the text is the
+    # same as the last text that passed here and the field is still white, there is nothing to do. The
+    # remembered text is forgotten when a check fails or the text is replaced by set_entry_text, so a
+    # field is never left showing the wrong color.
     #
+    widget_value = widget.get().strip()
+    if widget_value == getattr(widget, 'checked_text', None) and getattr(widget, 'entry_color', None) == "WHITE":
+        return
     try:
-        widget_value = str(widget.get()).strip()
-        exprval = ne.evaluate(widget_value)
-        exprval = float(exprval)
-        print(exprval)
-        widget.config(bg="WHITE")
-    except KeyError:
-        widget.config(bg="RED")
-        mb.showerror("error", widget_value + " does not evaluate to a number")
-    except SyntaxError:
-        widget.config(bg="RED")
-        mb.showerror("error", widget_value + " does not evaluate to a number")
+        exprval = evaluate_expression(widget_value)
     except ZeroDivisionError:
-        widget.config(bg="RED")
-        mb.showerror("error", widget_value + " has a divide by zero error")
+        message = widget_value + " has a divide by zero error"
     except OverflowError:
-        widget.config(bg="RED")
-        mb.showerror("error", widget_value + " overflows")
+        message = widget_value + " overflows"
     except TypeError:
-        widget.config(bg="RED")
-        mb.showerror("error", widget_value + " is an invalid expression")
+        message = widget_value + " is an invalid expression"
+    except (SyntaxError, ValueError):
+        message = widget_value + " does not evaluate to a number"
+    else:
+        logger.debug("%s evaluates to %s", widget_value, exprval)
+        set_entry_color(widget, "WHITE")
+        widget.checked_text = widget_value
+        return
+    widget.checked_text = None
+    set_entry_color(widget, "RED")
+    mb.showerror("error", message)
 
 # Gui callbacks (command functions)
 
 
-def check_select_change(line, val):
-    print("check select changed...index: " + str(line))
-    print("checkbutton state: " + str(val.get()))
-    if val.get():
-        plist.select_row(line)
-    else:
+#
+# Check button callback. Clicking the check button of the selected row unchecks it, and clicking any
+# other one checks it, so row_selected tells us which way the button just went.
+#
+def check_select_change(check_button):
+    line = plist.find_row(check_button)
+    logger.debug("check select changed...index: %d, previously selected: %d", line, plist.row_selected)
+    if line == plist.row_selected:
         plist.deselect_row(line)
+    else:
+        plist.select_row(line)
 
 
 def open_pressed():
     # Open means read a coordinates file and make the points in that file the current points in 
     # the application. That file also has values for depth and plunge rate.
+    global current_data_file
     if not mb.askyesno("Are you sure?", "Current data will be deleted."):
         return
     else:
         open_file = filedialog.askopenfilename(title='Open File', initialdir=config['default_data_path'])
+        if not open_file:
+            return  # user cancelled
+
+        # The data file is in XML format. We read it with the incremental Python XML parser, collecting
+        # the field values and the (x, y) expression pairs as each element is closed, so a point's
+        # elements can be thrown away as soon as its expressions are read. Nothing in the GUI is changed
+        # until the whole file has been read, so a file with an XML syntax error leaves the current data
+        # alone.
+        # The xexpr and yexpr of a point close before the point does, so their text is held until then.
+        fields = {}  # text of the unitsel, modesel, depthexpr and plungeexpr tags
+        pairs = []  # (x, y) expression pairs, added to plist in one batch after the file is read
+        x_text = y_text = None
+        try:
+
+            for event, element in Et.iterparse(open_file):
+                if element.tag == 'xexpr':
+                    x_text = element.text
+                elif element.tag == 'yexpr':
+                    y_text = element.text
+                elif element.tag == 'point':
+                    pairs.append((x_text, y_text))
+                    x_text = y_text = None
+                    element.clear()
+                elif element.tag in ('unitsel', 'modesel', 'depthexpr', 'plungeexpr'):
+                    fields[element.tag] = element.text
+
+        except Et.ParseError:
+            mb.showerror("Data file XML Syntax Error", "Data File XML Syntax Error")
+            return
+        except OSError as error:
+            mb.showerror("File Error", "Could not read this file: " + str(error))
+            return
+        if len(fields) < 4:
+            mb.showerror("Data file error", "Data file is missing the units, mode, depth or plunge rate")
+            return
+
+        show_data(fields, pairs)
+        current_data_file = open_file
         # update window title
         window.title('Spot Drilling Tool: ' + open_file)
         # update the configuration dictionary with the returned path and file name
@@ -581,211 +887,114 @@ def open_pressed():
         config['default_data_path'] = path_file[0]
         config['default_data_file'] = path_file[1]
         update_config_file()
-        # open the coordinates file. This is just a pair of expressions on each line, x, then y, separated by a comma
-        # For parsing, we just use the split(',') string method. Not much error checking here. If the file does
-        # not have the right number of tokens in each line, things will break. The assumption is that the program
-        # only reads files it creates, and that these are right. More stuff can be added, but we just bail if
-        # there is a problem.
-
-        # The data file is in XML format. We read and parse it with the Python XML parser, then
-        # do "find" operations on the resulting data tree to get the data fields.
-        # Open and parse the file, catching any xml parse error.
-        try:
-
-            xmltree = Et.parse(open_file)
-
-        except xml.etree.ElementTree.ParseError:
-            mb.showerror("Data file XML Syntax Error", "Data File XML Syntax Error")
-            return
-
-        # Get the root of the data tree
-        xmltree_root = xmltree.getroot()
-
-        # the unit selection and mode selection menu values are at the top level of children, so we can
-        # just find them in the root and set the values in the GUI.
-        unitsel = xmltree_root.find('unitsel')
-        inch_mm_select_var.set(unitsel.text)
-        modesel = xmltree_root.find('modesel')
-        abs_rel_select_var.set(modesel.text)
-
-        # The depth and plunge values are also at the top level
-        depthexpr = xmltree_root.find('depthexpr')
-        depth_entry.delete(0, tk.END)
-        depth_entry.insert(0, depthexpr.text)
-        plungeexpr = xmltree_root.find('plungeexpr')
-        plunge_entry.delete(0, tk.END)
-        plunge_entry.insert(0, plungeexpr.text)
-
-        # find the points tag, then iterate through the points and find the x and y expressions for each.
-        #
-        plist.clear()  # clear the existing points list
-        points = xmltree_root.find('points')  # find the points tag in the XML root.
-        for point in points.findall('point'):  # find each point tag in the points tag.
-            # For each point, find the x and y expressions and append them to the plist.
-            x = point.find('xexpr')
-            y = point.find('yexpr')
-            # xval = x.text
-            # if not xval:
-            #     xval = ' '
-            # print(x.text, ',', y.text)
-            # if x.text == none:
-
-            plist.append_point(point.find('xexpr').text, point.find('yexpr').text)
 
 
+#
+# New menu callback. After checking with the user, erase everything and present the GUI with the
+# defaults in NEWDATA and no points. The new data has no file until it is saved.
+#
 def new_pressed():
-
-    # Create an XML element tree from the data we want to save. The .text and .tail white space
-    # values are for making the file easier to read. They have no impact on the actual
-    # data. A .text string is added after an opening tag. Here we use it after <spotdrill> and
-    # <points> to start and indent a new line. A .tail string is added after a closing tag. Here
-    # we use it for starting new lines after single line tags to start and indent the next line.
-    root = Et.Element("spotdrill")
-    root.text = "\n  "
-
-    unitsel = Et.SubElement(root, "unitsel")
-    unitsel.text = "Unit: Inches"
-    unitsel.tail = "\n  "
-
-    modesel = Et.SubElement(root, "modesel")
-    modesel.text = "Mode: Absolute"
-    modesel.tail = "\n  "
-
-    depthexpr = Et.SubElement(root, "depthexpr")
-    depthexpr.text = ".1 + 1"
-    depthexpr.tail = "\n  "
-
-    plungeexpr = Et.SubElement(root,"plungeexpr")
-    plungeexpr.text = "100"
-    plungeexpr.tail = "\n  "
-
-    points = Et.SubElement(root, "points")
-    points.text = "\n    "  # double indent next line
-
-    xmlpoint = Et.SubElement(points, "point")
-    x = Et.SubElement(xmlpoint, "xexpr")
-    x.text = "3.14"
-    y = Et.SubElement(xmlpoint, "yexpr")
-    y.text = ".001592"
-    xmlpoint.tail = "\n    "  # double indent next line
-
-    xmlpoint = Et.SubElement(points, "point")
-    x = Et.SubElement(xmlpoint, "xexpr")
-    x.text = "456"
-    y = Et.SubElement(xmlpoint, "yexpr")
-    y.text = "123"
-    xmlpoint.tail = "\n    "  # double indent next line
-
-    xmlpoint = Et.SubElement(points, "point")
-    x = Et.SubElement(xmlpoint, "xexpr")
-    x.text = "3.0"
-    y = Et.SubElement(xmlpoint, "yexpr")
-    y.text = ".141592"
-    xmlpoint.tail = "\n  "  # single indent next line because this is the end of the last point, going back to points.
-
-    points.tail = "\n"  # no indent because this is the end of points, going back to root
-
-    tree = Et.ElementTree(root)
-
-    tree.write("C:/Users/ed/Documents/CNC/testwrite_file_xml")
-
-
-
+    global current_data_file
+    if not mb.askyesno("Are you sure?", "Current data will be deleted."):
+        return
+    show_data(NEWDATA, [])
+    current_data_file = ''
+    window.title('Spot Drilling Tool')
 
 
+#
+# Replace the data in the GUI. fields holds the text for the unit and mode menus and the depth and
+# plunge rate entries, keyed by their data file tags, and pairs is a list of (x, y) expression pairs
+# for the points. Used by open_pressed with the data read from a file, and by new_pressed.
+#
+def show_data(fields, pairs):
+    global mode_in_use, unit_in_use
 
+    # set the unit selection and mode selection menu values in the GUI.
+    inch_mm_select_var.set(fields['unitsel'])
+    unit_in_use = fields['unitsel']
+    abs_rel_select_var.set(fields['modesel'])
+    mode_in_use = fields['modesel']
 
+    # The depth and plunge values
+    set_entry_text(depth_entry, fields['depthexpr'])
+    set_entry_text(plunge_entry, fields['plungeexpr'])
 
+    # replace the existing points with the new ones.
+    #
+    plist.clear()  # clear the existing points list
+    plist.append_points(pairs)
 
 
 def save_data(file_path):
+    global current_data_file
 
-    # Create an XML element tree from the data we want to save. The .text and .tail white space
-    # values are for making the file easier to read. They have no impact on the actual
-    # data. A .text string is added after an opening tag. Here we use it after <spotdrill> and
-    # <points> to start and indent a new line. A .tail string is added after a closing tag. Here
-    # we use it for starting new lines after single line tags to start and indent the next line.
+    # Create an XML element tree from the data we want to save. Et.indent adds the white space that
+    # makes the file easier to read, putting each element on its own line, indented two spaces
+    # per level. It has no impact on the actual data.
     # note we allow saving of the application state even when fields have not been filled. This
     # can result in null strings in the entry widgets, which creates null tags in the XML file,
     # and reading these into the XML tree from a file causes problems. To fix this, we just save
     # a blank instead of a null string, which is handled in expression evaluation
     root = Et.Element("spotdrill")
-    root.text = "\n  "
 
     unitsel = Et.SubElement(root, "unitsel")
     unitsel.text = inch_mm_select_var.get()
-    unitsel.tail = "\n  "
 
     modesel = Et.SubElement(root, "modesel")
     modesel.text = abs_rel_select_var.get()
-    modesel.tail = "\n  "
 
     depthexpr = Et.SubElement(root, "depthexpr")
-    if depth_entry.get() == '':
-        depthexpr.text = ' '
-    else:
-        depthexpr.text = depth_entry.get()
-    depthexpr.tail = "\n  "
+    depthexpr.text = depth_entry.get() or ' '
 
     plungeexpr = Et.SubElement(root, "plungeexpr")
-    if plunge_entry.get() == '':
-        plungeexpr.text = ' '
-    else:
-        plungeexpr.text = plunge_entry.get()
-    plungeexpr.tail = "\n  "
+    plungeexpr.text = plunge_entry.get() or ' '
 
     points = Et.SubElement(root, "points")
-    points.text = "\n    "  # double indent next line
 
     # Add the points to the XML tree. Note xmlpoint, x, and y just serve as temporary variables
     # that reference tree items on each time around the loop.
-    for i in range(0, plist.point_count):
-        point = plist.read_point(i)  # read point from point list object
+    for point in plist.points:
         # Create the point and x and y subelements in the XML tree. Note we do not
         # save null x or y values to the xml file because it causes problems on read.
         xmlpoint = Et.SubElement(points, "point")
         x = Et.SubElement(xmlpoint, "xexpr")
-        if point[XWIDGET] == '':
-            x.text = ' '
-        else:
-            x.text = point[XWIDGET]
+        x.text = point[XWIDGET].get() or ' '
         y = Et.SubElement(xmlpoint, "yexpr")
-        if point[YWIDGET] == '':
-            y.text = ' '
-        else:
-            y.text = point[YWIDGET]
-        if i == plist.point_count-1:
-            xmlpoint.tail = "\n  "  # last point...single indent next line
-        else:
-            xmlpoint.tail = "\n    "  # double indent next point line
+        y.text = point[YWIDGET].get() or ' '
 
-    points.tail = "\n"  # new line, but no indent because this is the end of points, going back to root
+    Et.indent(root, space='  ')
 
-    # create and save the tree. Error handler in case we try to write an illegal file
-    tree = Et.ElementTree(root)
+    # serialize the tree and save it with a single write. Error handler in case we try to write an illegal file
+    data = Et.tostring(root)
     try:
-        tree.write(file_path)
-
-        # update the default save path
-        path_file = os.path.split(file_path)
-        # update window title
-        window.title('Spot Drilling Tool: ' + file_path)
-        # update the configuration dictionary with the returned path and file name
-        path_file_list = os.path.split(file_path)
-        config['default_data_path'] = path_file_list[0]
-        config['default_data_file'] = path_file_list[1]
-        update_config_file()
+        with open(file_path, 'wb') as data_file:
+            data_file.write(data)
     except PermissionError:
         mb.showerror("Permission Error", "No permission to write this file")
+        return
+    except OSError as error:
+        mb.showerror("File Error", "Could not write this file: " + str(error))
+        return
+
+    current_data_file = file_path
+    # update window title
+    window.title('Spot Drilling Tool: ' + file_path)
+    # update the configuration dictionary with the returned path and file name
+    path_file_list = os.path.split(file_path)
+    config['default_data_path'] = path_file_list[0]
+    config['default_data_file'] = path_file_list[1]
+    update_config_file()
 
 
-# save button callback. Save the program data to the default data file path stored in the
-# config dictionary.
+# save button callback. Save the program data to the file it was read from or last saved to. If
+# there is no such file yet, as after New, this becomes a save as.
 #
 def save_pressed():
-    save_path = config['default_data_path'] + '/' + config['default_data_file']
-    print(save_path)
-    save_data(save_path)
+    if not current_data_file:
+        save_as_pressed()
+        return
+    save_data(current_data_file)
 
 
 #
@@ -796,68 +1005,151 @@ def save_pressed():
 def save_as_pressed():
     save_file = filedialog.asksaveasfilename(
         title='Save As...', initialdir=config['default_data_path'], initialfile=config['default_data_file'])
+    if not save_file:
+        return  # user cancelled
     save_data(save_file)
 
 
-
 #
 # when Add Point is pressed, we add a point at the end of the points list by calling
 #
 def addpoint_pressed():
-    print("Add Point button")
+    logger.debug("Add Point button")
     plist.append_point('', '')
 
 
 def deletepoint_pressed():
-    print("Delete Point button, row_selected = " + str(plist.row_selected))
+    logger.debug("Delete Point button, row_selected = %d", plist.row_selected)
     plist.delete_point(plist.row_selected)
-    for delpoint in plist.points:
-        print(delpoint)
 
 
+#
+# Write GCode button callback. Evaluate the depth, plunge rate and every point coordinate, prompt the user
+# for a gcode file, and write the gcode for spot drilling all of the points to it. Nothing is written if
+# any field does not evaluate to a number. The gcode is built up in memory and written to the file with
+# a single write, so the file is only opened for as long as that takes.
+#
 def gen_gcode_pressed():
-    print("Points for GCode")
-    print("row_selected: " + str(plist.row_selected))
-    for ptindex in range(0, len(plist.points)):
-        print(plist.read_point(ptindex))
+    if plist.point_count == 0:
+        mb.showerror("GCode Error", "There are no points to drill")
+        return
+    #
+    # Evaluate all of the fields in window order, so every bad one is marked and reported together.
+    bad_fields = []
+    depth = evaluate_field("Depth", depth_entry, bad_fields)
+    plunge_rate = evaluate_field("Plunge Rate", plunge_entry, bad_fields)
+    coords = plist.evaluate_points(bad_fields)
+    if bad_fields:
+        show_bad_fields(bad_fields)
+        return
+    #
+    # The fields are numbers, but the machine also needs a depth to drill to and a feed rate it can move at.
+    # The gcode is written to four decimal places, so check the values as they will be written.
+    if round(depth, 4) == 0:
+        mb.showerror("GCode Error", "The depth must not be zero")
+        return
+    if round(plunge_rate, 4) <= 0:
+        mb.showerror("GCode Error", "The plunge rate must be greater than zero")
+        return
+    if abs_rel_select_var.get() == 'Mode: Relative':
+        coords = relative_to_absolute(coords)
+
+    gcode_file = filedialog.asksaveasfilename(
+        title='Write GCode', initialdir=config['default_gcode_path'], initialfile=config['default_gcode_file'],
+        defaultextension='.nc')
+    if not gcode_file:
+        return  # user cancelled
+    gcode = generate_gcode(depth, plunge_rate, coords, inch_mm_select_var.get() == 'Unit: Millimeters')
+    try:
+        with open(gcode_file, "w") as outfile:
+            outfile.write(gcode)
+    except PermissionError:
+        mb.showerror("Permission Error", "No permission to write this file")
+        return
+    except OSError as error:
+        mb.showerror("File Error", "Could not write this file: " + str(error))
+        return
+    # update the configuration dictionary with the gcode path and file name
+    path_file_list = os.path.split(gcode_file)
+    config['default_gcode_path'] = path_file_list[0]
+    config['default_gcode_file'] = path_file_list[1]
+    update_config_file()
 
 
 def exit_pressed():
-    print("Exit button. Clean up has to happen here.")
+    logger.debug("Exit button. Clean up has to happen here.")
     clean_up_and_exit()
 
 
-def abs_rel_select_var_changed(*args):
-    print("Absolute/Relative Menu Changed")
-    print(abs_rel_select_var.get())
-
-
-def inch_mm_select_var_changed(*args):
-    print("Inch/mm menu changed")
-    print(inch_mm_select_var.get())
+#
+# Mode menu callback. Rewrite the points in the newly selected mode, so they still describe the same
+# holes. If a point does not evaluate to a number, the menu goes back to the mode the points are in.
+#
+def abs_rel_select_var_changed(new_mode):
+    global mode_in_use
+    if new_mode == mode_in_use:
+        return
+    bad_fields = []
+    coords = plist.evaluate_points(bad_fields)
+    if bad_fields:
+        show_bad_fields(bad_fields)
+        abs_rel_select_var.set(mode_in_use)
+        return
+    if coords:
+        if new_mode == 'Mode: Relative':
+            plist.write_points(absolute_to_relative(coords), UNITPLACES[unit_in_use])
+        else:
+            plist.write_points(relative_to_absolute(coords), UNITPLACES[unit_in_use])
+    mode_in_use = new_mode
 
 
-def add_button_pressed():
-    print("Add Point button")
+#
+# Unit menu callback. Scale the points, depth and plunge rate into the newly selected unit. Fields that are
+# still empty are left empty. If any of the others does not evaluate to a number, the menu goes back to the
+# unit they are in.
+#
+def inch_mm_select_var_changed(new_unit):
+    global unit_in_use
+    if new_unit == unit_in_use:
+        return
+    bad_fields = []
+    depth = evaluate_field("Depth", depth_entry, bad_fields, allow_blank=True)
+    plunge_rate = evaluate_field("Plunge Rate", plunge_entry, bad_fields, allow_blank=True)
+    coords = plist.evaluate_points(bad_fields, allow_blank=True)
+    if bad_fields:
+        show_bad_fields(bad_fields)
+        inch_mm_select_var.set(unit_in_use)
+        return
+    if new_unit == 'Unit: Millimeters':
+        scale = MMPERINCH
+    else:
+        scale = 1 / MMPERINCH
+    places = UNITPLACES[new_unit]
+    if depth is not None:
+        set_entry_text(depth_entry, format_number(depth * scale, places))
+    if plunge_rate is not None:
+        set_entry_text(plunge_entry, format_number(plunge_rate * scale, places))
+    plist.write_points([(x if x is None else x * scale, y if y is None else y * scale) for x, y in coords], places)
+    unit_in_use = new_unit
 
 
 def up_button_pressed():
-    print("up button pressed")
+    logger.debug("up button pressed")
     plist.move_point_backward(plist.row_selected)
 
 
 def down_button_pressed():
-    print("down button pressed")
+    logger.debug("down button pressed")
     plist.move_point_forward(plist.row_selected)
 
 
 def clean_up_and_exit():
-    print("cleanup and exit called")
+    logger.debug("cleanup and exit called")
     window.destroy()
 
 
 def on_closing():
-    print("on_closing called")
+    logger.debug("on_closing called")
     if mb.askokcancel("Quit", "Do you want to quit?"):
         clean_up_and_exit()
 
@@ -870,187 +1162,189 @@ def on_closing():
 def init_config():
     global config
     #
-    # The config file lives in the same file as the python source code, and it is
-    # called config. This code checks to see if it exists. If so, it reads it into
-    # a list of lines called config_file_lines. If it does not exist, a default one
+    # The config file lives in the same directory as the python source code, and it is
+    # called config. This code tries to read it into a list of lines called
+    # config_file_lines, with the line endings already split off. If it does not
+    # exist, a default one
     # is created, setting the starting data file path to the user's home directory
     # (in windows, %HOMEDRIVE%%HOMEPATH%) and the data file name to DEFAULTDATAFILENAME
     # and the gcode file name to DEFAULTGCODEFILENAME.
-    if os.path.exists(config_path):
-        # config file exists. Read it.
-        config_file = open(config_path, "r")
-        config_file_lines = config_file.readlines()
-        config_file.close()
-    else:
+    try:
+        # Read the config file in one go and split it into lines.
+        with open(config_path, "r") as config_file:
+            config_file_lines = config_file.read().splitlines()
+    except FileNotFoundError:
         # config file does not exist. Create a default one.
-        user_home_path = os.path.expanduser("~").replace("\\", "/") # set path to user home
-        print(user_home_path)
-        config_file_lines = [user_home_path + "\n",
+        logger.debug(USERHOMEPATH)
+        config_file_lines = [USERHOMEPATH + "\n",
                              DEFAULTDATAFILENAME + "\n",
-                             user_home_path + "\n",
+                             USERHOMEPATH + "\n",
                              DEFAULTGCODEFILENAME]  # create the config file lines
-        config_file = open(config_path, "w")
-        config_file.writelines(config_file_lines)
-        config_file.close()
+        # If the program's directory can't be written, carry on with the defaults for this session.
+        try:
+            with open(config_path, "w") as config_file:
+                config_file.writelines(config_file_lines)
+        except OSError as error:
+            logger.warning("Could not create config file %s: %s", config_path, error)
+        config_file_lines = [line.rstrip("\n") for line in config_file_lines]
     # Put all config data into the global config dictionary
-    config["default_data_path"] = config_file_lines[0].rstrip("\n")
-    config["default_data_file"] = config_file_lines[1].rstrip("\n")
-    config["default_gcode_path"] = config_file_lines[2].rstrip("\n")
-    config["default_gcode_file"] = config_file_lines[3].rstrip("\n")
-    print(config)
+    config["default_data_path"] = config_file_lines[0]
+    config["default_data_file"] = config_file_lines[1]
+    config["default_gcode_path"] = config_file_lines[2]
+    config["default_gcode_file"] = config_file_lines[3]
+    logger.debug(config)
 
 
 def update_config_file():
-    # config file is assumed to exist because init_config() was called before.
-    # update the config file with new default save path and file.
-    #     config_file = open(
-    user_home_path = os.path.expanduser("~").replace("\\", "/")  # set path to user home
+    # update the config file with new default save path and file. The new file is written next
+    # to the old one and then renamed over it, so a failed write never leaves a half written
+    # config file behind. If it can't be written at all, for instance because the program is
+    # installed in a read-only directory, the config dictionary still holds the new values for
+    # the rest of this session, so just log it and remove any partly written new file.
     config_file_lines = [config["default_data_path"] + "\n",
                          config["default_data_file"] + "\n",
                          config["default_gcode_path"] + "\n",
-                         config["default_gcode_path"]]
-    config_file = open(config_path, "w")
-    config_file.writelines(config_file_lines)
-    config_file.close()
+                         config["default_gcode_file"]]
+    new_config_path = config_path + ".new"
+    try:
+        with open(new_config_path, "w") as config_file:
+            config_file.writelines(config_file_lines)
+        os.replace(new_config_path, config_path)
+    except OSError as error:
+        logger.warning("Could not update config file %s: %s", config_path, error)
+        try:
+            os.remove(new_config_path)
+        except OSError:
+            pass  # it was never created
 # end def update_config_file
 
 # Start up code
 
 
-# create global working points list object
-plist = PointsList()
-
-#
-init_config()
-# default_save_path = config_list[0]
-# default_save_file = config_list[1]
-print(config)
-# gcodeFile = open(gcodeFileName, "w")
-
-# set up the GUI
-window = tix.Tk()
-s = ttk.Style()
-s.theme_use('xpnative')
-s.configure('window.TFrame', font=('Helvetica', 30))
-#
-# create and size the main window
-#
-window.title('Spot Drilling Tool')
-# Test code for PointList class and initial points for testing.
-# print('initial point list')
-# for point in plist.points:
-#     print(point)
-# print('appending point')
-# plist.append_point('', 2.0)
-# for point in plist.points:
-#     print(point)
-# print('appending point')
-# plist.append_point(3.0, 4.0)
-# for point in plist.points:
-#     print(point)
-# print('appending point')
-# plist.append_point(5.0, 6.0)
-# for point in plist.points:
-#     print(point)
-# print('appending point')
-# plist.append_point(7.0, 8.0)
-# for point in plist.points:
-#     print(point)
-# end of class PointsList test code
-
-menu_bar = tk.Menu(window)
-filemenu = tk.Menu(menu_bar, tearoff=1)
-filemenu.add_command(label="New", command=new_pressed)
-filemenu.add_command(label="Open", command=open_pressed)
-filemenu.add_command(label="Save", command=save_pressed)
-filemenu.add_command(label="Save as...", command=save_as_pressed)
-filemenu.add_command(label="Write GCode", command=gen_gcode_pressed)
-filemenu.add_command(label="Exit", command=exit_pressed)
-menu_bar.add_cascade(label="File", menu=filemenu)
-
-#
-# Create the GUI widgets
-#
-helv12bold = tk.font.Font(family='Helvetica', size=12, weight='bold')
-arrowfont = tk.font.Font(family='tt-icon-font', size=12, weight='bold')
-
-button_frame = ttk.Frame(window)
-depth_text = tk.StringVar()
-depth_label = tk.Label(window, textvariable=depth_text, font=helv12bold)
-depth_text.set('Depth')
-
-plunge_text = tk.StringVar()
-plunge_label = tk.Label(window, textvariable=plunge_text, font=helv12bold)
-plunge_text.set('Plunge Rate')
-
-depth_entry = tk.Entry(window)
-depth_entry.bind('<FocusOut>', check_if_num)
-
-plunge_entry = tk.Entry(window)
-plunge_entry.bind('<FocusOut>', check_if_num)
-
-# code for sampling fonts up_button = Button(window,
-# text="abcdefghijklmnopqrstuvwxyz0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ", font='tt-icon-font 12',
-# command=up_button_pressed)
-
-up_tip = tix.Balloon(button_frame)
-up_button = tk.Button(button_frame, text="  k  ", font=arrowfont, command=up_button_pressed)
-up_tip.bind_widget(up_button, balloonmsg="Swap selected point with the one above it")
-
-down_tip = tix.Balloon(button_frame)
-down_button = tk.Button(button_frame, text="  c  ", font=arrowfont, command=down_button_pressed)
-down_tip.bind_widget(down_button, balloonmsg="Swap selected point with the one below it")
-
-addpoint_tip = tix.Balloon(button_frame)
-addpoint_button = tk.Button(button_frame, text="Add Point", font=helv12bold, command=addpoint_pressed)
-addpoint_tip.bind_widget(addpoint_button, balloonmsg="Add a point at the end")
-
-delpoint_tip = tix.Balloon(button_frame)
-delpoint_button = tk.Button(button_frame, text="Delete Point", font=helv12bold, command=deletepoint_pressed)
-delpoint_tip.bind_widget(delpoint_button, balloonmsg="Delete selected point")
-
-x_text = tk.StringVar()
-x_label = tk.Label(window, textvariable=x_text, font=helv12bold)
-x_text.set('    X    ')
-
-y_text = tk.StringVar()
-y_label = tk.Label(window, textvariable=y_text, font=helv12bold)
-y_text.set('    Y    ')
-
-inch_mm_select_var = tk.StringVar(button_frame)
-inch_mm_select_var.set("Unit: Inches")
-inch_mm_select_menu = tk.OptionMenu(button_frame, inch_mm_select_var, 'Unit: Inches', 'Unit: Millimeters')
-inch_mm_select_menu.config(font=helv12bold)
-inch_mm_select_var.trace('w', inch_mm_select_var_changed)
-
-abs_rel_select_var = tk.StringVar(button_frame)
-abs_rel_select_var.set("Mode: Absolute")
-abs_rel_select_menu = tk.OptionMenu(button_frame, abs_rel_select_var, 'Mode: Absolute', 'Mode: Relative')
-abs_rel_select_menu.config(font=helv12bold)
-abs_rel_select_var.trace('w', abs_rel_select_var_changed)
-
-#
-# Place the widgets in the window
-#
-depth_label.grid(row=0, column=0, padx=4, pady=0)
-plunge_label.grid(row=0, column=1, padx=4, pady=4)
-depth_entry.grid(row=1, column=0, padx=4, pady=0)
-plunge_entry.grid(row=1, column=1, padx=4, pady=0)
-x_label.grid(row=2, column=0, padx=4, pady=0)
-y_label.grid(row=2, column=1, padx=4, pady=0)
-button_frame.grid(row=0, column=3, rowspan=10)
-inch_mm_select_menu.grid(row=0, column=0, padx=0, pady=4, sticky=tk.W)
-abs_rel_select_menu.grid(row=1, column=0, padx=0, pady=4, sticky=tk.W)
-addpoint_button.grid(row=2, column=0, sticky=tk.W)
-up_button.grid(row=3, column=0, sticky=tk.W)
-down_button.grid(row=4, column=0, sticky=tk.W)
-delpoint_button.grid(row=5, column=0, sticky=tk.W)
-
-# set up a window menu
-window.config(menu=menu_bar)
-
-# bind window manager delete window to the on_closing function
-window.protocol("WM_DELETE_WINDOW", on_closing)
-
-# Start the GUI main look
-window.mainloop()
+#
+# main sets up the GUI and runs it. The widgets and objects that the callbacks above use are
+# module globals, set here.
+#
+def main():
+    global plist, window, expression_vcmd, points_frame, depth_entry, plunge_entry
+    global inch_mm_select_var, abs_rel_select_var
+
+    logging.basicConfig(level=logging.DEBUG if DEBUG else logging.WARNING)
+
+    # create global working points list object
+    plist = PointsList()
+
+    #
+    init_config()
+
+    # set up the GUI
+    window = tix.Tk()
+    # validatecommand for the coordinate entry widgets. See valid_expression_keys.
+    expression_vcmd = (window.register(valid_expression_keys), '%d', '%S')
+    s = ttk.Style()
+    s.theme_use('xpnative')
+    #
+    # create and size the main window
+    #
+    window.title('Spot Drilling Tool')
+
+    menu_bar = tk.Menu(window)
+    filemenu = tk.Menu(menu_bar, tearoff=1)
+    filemenu.add_command(label="New", command=new_pressed)
+    filemenu.add_command(label="Open", command=open_pressed)
+    filemenu.add_command(label="Save", command=save_pressed)
+    filemenu.add_command(label="Save as...", command=save_as_pressed)
+    filemenu.add_command(label="Write GCode", command=gen_gcode_pressed)
+    filemenu.add_command(label="Exit", command=exit_pressed)
+    menu_bar.add_cascade(label="File", menu=filemenu)
+
+    #
+    # Create the GUI widgets
+    #
+    helv12bold = font.Font(family='Helvetica', size=12, weight='bold')
+    arrowfont = font.Font(family='tt-icon-font', size=12, weight='bold')
+
+    button_frame = ttk.Frame(window)
+    # The point rows get a frame of their own, so adding, deleting or moving a point only makes Tk lay out
+    # the points frame, not every widget in the main window.
+    points_frame = ttk.Frame(window)
+    depth_label = tk.Label(window, text='Depth', font=helv12bold)
+
+    plunge_label = tk.Label(window, text='Plunge Rate', font=helv12bold)
+
+    # The depth and plunge rate entries filter keystrokes the same way the point entries do, and
+    # are checked for a number when they lose focus.
+    depth_entry = tk.Entry(window, validate='key', validatecommand=expression_vcmd)
+    depth_entry.bind('<FocusOut>', check_if_num)
+
+    plunge_entry = tk.Entry(window, validate='key', validatecommand=expression_vcmd)
+    plunge_entry.bind('<FocusOut>', check_if_num)
+
+    up_tip = tix.Balloon(button_frame)
+    up_button = tk.Button(button_frame, text="  k  ", font=arrowfont, command=up_button_pressed)
+    up_tip.bind_widget(up_button, balloonmsg="Swap selected point with the one above it")
+
+    down_tip = tix.Balloon(button_frame)
+    down_button = tk.Button(button_frame, text="  c  ", font=arrowfont, command=down_button_pressed)
+    down_tip.bind_widget(down_button, balloonmsg="Swap selected point with the one below it")
+
+    addpoint_tip = tix.Balloon(button_frame)
+    addpoint_button = tk.Button(button_frame, text="Add Point", font=helv12bold, command=addpoint_pressed)
+    addpoint_tip.bind_widget(addpoint_button, balloonmsg="Add a point at the end")
+
+    delpoint_tip = tix.Balloon(button_frame)
+    delpoint_button = tk.Button(button_frame, text="Delete Point", font=helv12bold, command=deletepoint_pressed)
+    delpoint_tip.bind_widget(delpoint_button, balloonmsg="Delete selected point")
+
+    x_label = tk.Label(window, text='    X    ', font=helv12bold)
+
+    y_label = tk.Label(window, text='    Y    ', font=helv12bold)
+
+    inch_mm_select_var = tk.StringVar(button_frame)
+    inch_mm_select_var.set("Unit: Inches")
+    # The menu command is called once each time the user picks an entry from the menu. Setting the
+    # variable from code, as open does, does not call it.
+    inch_mm_select_menu = tk.OptionMenu(button_frame, inch_mm_select_var, 'Unit: Inches', 'Unit: Millimeters',
+                                        command=inch_mm_select_var_changed)
+    inch_mm_select_menu.config(font=helv12bold)
+
+    abs_rel_select_var = tk.StringVar(button_frame)
+    abs_rel_select_var.set("Mode: Absolute")
+    abs_rel_select_menu = tk.OptionMenu(button_frame, abs_rel_select_var, 'Mode: Absolute', 'Mode: Relative',
+                                        command=abs_rel_select_var_changed)
+    abs_rel_select_menu.config(font=helv12bold)
+
+    #
+    # Place the widgets in the window
+    #
+    depth_label.grid(row=0, column=0, padx=4, pady=0)
+    plunge_label.grid(row=0, column=1, padx=4, pady=4)
+    depth_entry.grid(row=1, column=0, padx=4, pady=0)
+    plunge_entry.grid(row=1, column=1, padx=4, pady=0)
+    x_label.grid(row=2, column=0, padx=4, pady=0)
+    y_label.grid(row=2, column=1, padx=4, pady=0)
+    points_frame.grid(row=POINTSFRAMEROW, column=XCOLUMN, columnspan=3, sticky=tk.N + tk.W)
+    # the buttons span the label and entry rows and the points frame, and stay at the top as points are added
+    button_frame.grid(row=0, column=3, rowspan=POINTSFRAMEROW + 1, sticky=tk.N)
+    inch_mm_select_menu.grid(row=0, column=0, padx=0, pady=4, sticky=tk.W)
+    abs_rel_select_menu.grid(row=1, column=0, padx=0, pady=4, sticky=tk.W)
+    addpoint_button.grid(row=2, column=0, sticky=tk.W)
+    up_button.grid(row=3, column=0, sticky=tk.W)
+    down_button.grid(row=4, column=0, sticky=tk.W)
+    delpoint_button.grid(row=5, column=0, sticky=tk.W)
+
+    # set up a window menu
+    window.config(menu=menu_bar)
+
+    # bind window manager delete window to the on_closing function
+    window.protocol("WM_DELETE_WINDOW", on_closing)
+
+    # start out with the same data as File->New
+    show_data(NEWDATA, [])
+
+    # Start the GUI main look
+    window.mainloop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,15 @@
 #!/usr/bin/python3
 
-from tkinter import *
+import tkinter as tk
 
 def donothing():
-    filewin = Toplevel(root)
-    button = Button(filewin, text="Do nothing button")
+    filewin = tk.Toplevel(root)
+    button = tk.Button(filewin, text="Do nothing button")
     button.pack()
 
-root = Tk()
-menubar = Menu(root)
-filemenu = Menu(menubar, tearoff=0)
+root = tk.Tk()
+menubar = tk.Menu(root)
+filemenu = tk.Menu(menubar, tearoff=0)
 filemenu.add_command(label="New", command=donothing)
 filemenu.add_command(label="Open", command=donothing)
 filemenu.add_command(label="Save", command=donothing)
@@ -20,7 +20,7 @@ filemenu.add_separator()
 
 filemenu.add_command(label="Exit", command=root.quit)
 menubar.add_cascade(label="File", menu=filemenu)
-editmenu = Menu(menubar, tearoff=0)
+editmenu = tk.Menu(menubar, tearoff=0)
 editmenu.add_command(label="Undo", command=donothing)
 
 editmenu.add_separator()
@@ -32,7 +32,7 @@ editmenu.add_command(label="Delete", command=donothing)
 editmenu.add_command(label="Select All", command=donothing)
 
 menubar.add_cascade(label="Edit", menu=editmenu)
-helpmenu = Menu(menubar, tearoff=0)
+helpmenu = tk.Menu(menubar, tearoff=0)
 helpmenu.add_command(label="Help Index", command=donothing)
 helpmenu.add_command(label="About...", command=donothing)
 menubar.add_cascade(label="Help", menu=helpmenu)